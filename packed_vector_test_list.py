@@ -53,9 +53,14 @@ def get_port_info_from_json(netlist_file_path):
                  if data['first_idx'] == max_idx and min_idx != max_idx: # First index seen was highest -> [LSB:MSB]
                       msb, lsb = min_idx, max_idx
 
+            # Bit names in declaration order, MSB first, so packing never recomputes them per vector
+            step = -1 if msb > lsb else 1
+            bit_names = [f"{base_name}{i}" for i in range(msb, lsb + step, step)]
+
             port_info_list.append({
                 'name': base_name, 'is_vector': True,
-                'msb': msb, 'lsb': lsb, 'width': width
+                'msb': msb, 'lsb': lsb, 'width': width,
+                'bit_names': bit_names
             })
 
         for port_name in scalar_inputs:
@@ -121,25 +126,11 @@ def pack_test_vectors(unpacked_vector_file, port_info):
                 for port in port_info:
                     port_name = port['name']
                     if port['is_vector']:
-                        packed_value = ""
-                       
-                        start, end, step = 0, 0, 0
-                        if port['msb'] > port['lsb']: # Standard order [MSB:LSB]
-                            start, end, step = port['msb'], port['lsb'] - 1, -1 # Iterate MSB down to LSB
-                        else: # Reversed order [LSB:MSB]
-                             start, end, step = port['msb'], port['lsb'] + 1, 1 # Iterate MSB(low num) up to LSB(high num)
-
-                        # Build string exactly matching the declaration order
-                        for i in range(start, end, step):
-                            unpacked_bit_name = f"{port_name}{i}"
-                            # Use .upper() or .lower() on unpacked_bit_name if your
-                            # netlist (A/a) and vector file (A/a) have a case mismatch.
-                            
-                            bit_value = unpacked_vector.get(unpacked_bit_name, 'X')
-                            packed_value += bit_value
-                        
-
-                        packed_vector[port_name] = packed_value
+                        # Build string exactly matching the declaration order.
+                        # Use .upper() or .lower() on the bit names if your
+                        # netlist (A/a) and vector file (A/a) have a case mismatch.
+                        packed_vector[port_name] = ''.join(
+                            [unpacked_vector.get(bit_name, 'X') for bit_name in port['bit_names']])
                     else:
                        
                         
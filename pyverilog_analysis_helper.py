@@ -4,18 +4,24 @@ import copy
 import pyverilog
 import re
 import os
-from pyverilog.vparser.parser import parse
+from verilog_to_netlist import _load_ast_cached
 from pyverilog.vparser import ast
 from collections import defaultdict, deque
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 supported_primitives = {'xor', 'xnor', 'and', 'or', 'nand', 'nor', 'not', 'buf', 'bufif0', 'bufif1', 'notif0', 'notif1'}
+_NUM_RE = re.compile(r'_(\d+)\.v$')
     
 def create_json_netlist(verilog_file_path):
     """
     Parses a structural Verilog file and creates a JSON netlist.
+    The parse goes through the same on-disk AST cache as verilog_to_netlist.py.
     """
-    astt, directives = parse([verilog_file_path])
+    astt, directives = _load_ast_cached(verilog_file_path)
     netlist = {"modules": {}}
 
     module_port_info = {}
@@ -137,9 +143,20 @@ def create_json_netlist(verilog_file_path):
                         "connections": connections
                     }
         
-        netlist["modules"][module_name]["nets"] = sorted(list(all_nets))
+        netlist["modules"][module_name]["nets"] = sorted(all_nets)
         '''
 
+def _derive_output_name(verilog_file):
+    """
+    netlist_<number>.json for a <name>_<number>.v file, else netlist_<file stem>.json.
+    """
+    base_filename = os.path.basename(verilog_file)
+    match = _NUM_RE.search(base_filename)
+    if match:
+        return f'netlist_{match.group(1)}.json'
+    # Fallback for filenames not matching the pattern
+    return f'netlist_{os.path.splitext(base_filename)[0]}.json'
+
 def main():
     if len(sys.argv) < 2:
         print("Error. Could not find path to Verilog file.")
@@ -149,18 +166,14 @@ def main():
     
     generated_netlist = create_json_netlist(verilog_file)
     
-    base_filename = os.path.basename(verilog_file)
-    match = re.search(r'_(\d+)\.v$', base_filename)
-    if match:
-        number = match.group(1)
-        output_json_file = f'netlist_{number}.json'
-    else:
-        # Fallback for filenames not matching the pattern
-        filename_no_ext = os.path.splitext(base_filename)[0]
-        output_json_file = f'netlist_{filename_no_ext}.json'
+    output_json_file = _derive_output_name(verilog_file)
     
-    with open(output_json_file, 'w') as f:
-        json.dump(generated_netlist, f, indent=4)
+    if orjson is not None:
+        with open(output_json_file, 'wb') as f:
+            f.write(orjson.dumps(generated_netlist, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_json_file, 'w') as f:
+            json.dump(generated_netlist, f, indent=2)
         
     print(f"Successfully generated netlist at '{output_json_file}'")
 
@@ -3,13 +3,25 @@ import sys
 import argparse
 from logic_evaluator import compute
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 def simulate(netlist_path, input_words, fault):
 
     netlist = None 
 
     try:
-        with open(netlist_path, 'r') as f:
-            netlist = json.load(f)
+        if netlist_path.endswith('.msgpack'):
+            if msgpack is None:
+                print(f"Error: Reading '{netlist_path}' needs the msgpack package (pip install msgpack)")
+                sys.exit(1)
+            with open(netlist_path, 'rb') as f:
+                netlist = msgpack.unpack(f, raw=False)
+        else:
+            with open(netlist_path, 'r') as f:
+                netlist = json.load(f)
     except FileNotFoundError:
         print(f"Error: Netlist file not found at '{netlist_path}'")
         sys.exit(1)
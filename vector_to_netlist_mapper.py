@@ -10,7 +10,17 @@ import json
 import sys
 import os
 import re
+import functools
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+
+_TOKEN_RE = re.compile(r'(\w+)=(\S+)')
+_PORT_RE = re.compile(r'^([a-zA-Z_]\w*?)(\d+)$')
+
+# generated port mappers keyed by id() of their port structure so the cache
+# below can stay hashable; the structure is kept alongside to pin its id
+_port_mappers = {}
 
 
 def parse_netlist_ports(netlist_path):
@@ -31,7 +41,7 @@ def parse_netlist_ports(netlist_path):
    
     for port_name in ports.keys():
         
-        match = re.match(r'^([a-zA-Z_]\w*?)(\d+)$', port_name)
+        match = _PORT_RE.match(port_name)
 
         if match:
             # This is a vector bit
@@ -42,11 +52,13 @@ def parse_netlist_ports(netlist_path):
             if base_name not in port_structure:
                 port_structure[base_name] = {
                     'indices': [],      
+                    'prefixes': [],     # "<port><idx>=" for each entry of indices
                     'width': 0          
                 }
 
            
             port_structure[base_name]['indices'].append(bit_index)
+            port_structure[base_name]['prefixes'].append(f"{base_name}{bit_index}=")
             
             # Update width
             port_structure[base_name]['width'] += 1
@@ -62,97 +74,112 @@ def parse_user_input_line(line):
     """
     User convention: LEFTMOST bit is MSB
     """
-    assignments = OrderedDict()
-
-    # Split by whitespace and parse each assignment
-    tokens = line.strip().split()
+    return OrderedDict(_TOKEN_RE.findall(line))
 
-    for token in tokens:
-        if '=' in token:
-            port, value = token.split('=', 1)
-            assignments[port] = value
 
-    return assignments
+def build_port_mappers(port_structure):
+    """
+    Generates one straight-line function per port that turns the user value
+    into its netlist assignments, or None when a vector value has the wrong width.
+    """
+    mappers = {}
+    for port_name, port_info in port_structure.items():
+        if port_info is None:
+            # Single-bit port: direct assignment
+            src = f"def _mapper(v):\n    return {port_name + '='!r} + v\n"
+        else:
+            # Vector port: leftmost user bit lands on the last netlist bit
+            width = port_info['width']
+            terms = [f"{prefix!r} + v[{width - 1 - bit_position}]"
+                     for bit_position, prefix in enumerate(port_info['prefixes'])]
+            # A flat list display, not one long chain of +, so wide buses stay within
+            # the compiler's recursion limit
+            src = (f"def _mapper(v):\n"
+                   f"    if len(v) != {width}:\n"
+                   f"        return None\n"
+                   f"    return ' '.join([" + ", ".join(terms) + "])\n")
+        namespace = {}
+        exec(src, namespace)
+        mappers[port_name] = namespace['_mapper']
+    return mappers
 
 
 def map_to_netlist_format(user_assignments, port_structure):
+    """
+    Repeated assignment lines are served from a cache.
+    """
+    ps_id = id(port_structure)
+    if ps_id not in _port_mappers:
+        _port_mappers[ps_id] = (port_structure, build_port_mappers(port_structure))
+    return _map_cached(tuple(user_assignments.items()), ps_id)
+
+
+@functools.lru_cache(maxsize=65536)
+def _map_cached(items_tuple, ps_id):
     
+    mappers = _port_mappers[ps_id][1]
     result_parts = []
 
-    for port_name, user_value in user_assignments.items():
-        # Check if port exists in netlist
-        if port_name not in port_structure:
+    for port_name, user_value in items_tuple:
+        # Ports missing from the netlist have no mapper
+        mapper = mappers.get(port_name)
+        if mapper is None:
             continue
 
-        port_info = port_structure[port_name]
+        netlist_part = mapper(user_value)
+        if netlist_part is not None:
+            result_parts.append(netlist_part)
 
-        if port_info is None:
-            # Single-bit port: direct assignment
-            result_parts.append(f"{port_name}={user_value}")
-        else:
-            # Vector port: need careful mapping
-            indices = port_info['indices']  # In order of appearance
-            width = port_info['width']
+    return ' '.join(result_parts)
 
-            # Validate user input length
-            if len(user_value) != width:
-                continue
 
-           
-            
-            for bit_position, netlist_idx in enumerate(indices):
-                
-                
-                user_bit_index = width - 1 - bit_position
-                
-                bit_value = user_value[user_bit_index]
-                result_parts.append(f"{port_name}{netlist_idx}={bit_value}")
+def report_filename(netlist_filename):
+    """
+    Name of the report written for a netlist: unpacked_inp_<name>.txt for netlist_<name>.json.
+    """
+    base_name = os.path.basename(netlist_filename)
 
-    return ' '.join(result_parts)
+    if base_name.startswith('netlist_'):
+        base_name = base_name[8:]
 
+    # Remove '.json' extension
+    if base_name.endswith('.json'):
+        base_name = base_name[:-5]
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python vector_to_netlist_mapper.py <netlist_json_path> <user_input_txt_path>")
-        sys.exit(1)
+    return f"unpacked_inp_{base_name}.txt"
 
-    netlist_filename = sys.argv[1]
+
+def process_one(netlist_filename, user_input_path):
+    """
+    Maps one user input file against one netlist from the NETLISTS folder.
+    Returns the relative path of the written report, or None on error.
+    """
     netlist_path = os.path.join(os.getcwd(), 'NETLISTS', netlist_filename)
-    user_input_path = sys.argv[2]
 
     # Validate input files
     if not os.path.exists(netlist_path):
         print(f"Error: Netlist file not found: {netlist_path}")
-        sys.exit(1)
+        return None
 
     if not os.path.exists(user_input_path):
         print(f"Error: User input file not found: {user_input_path}")
-        sys.exit(1)
-
-    netlist_basename = os.path.basename(netlist_path)
+        return None
 
-    if netlist_basename.startswith('netlist_'):
-        base_name = netlist_basename[8:]
-    else:
-        base_name = netlist_basename
-
-    # Remove '.json' extension
-    if base_name.endswith('.json'):
-        base_name = base_name[:-5]
-
-   
     output_dir = os.path.join(os.getcwd(), 'MAPPING_RESULTS')
     os.makedirs(output_dir, exist_ok=True)
 
     
-    output_filename = f"unpacked_inp_{base_name}.txt"
+    output_filename = report_filename(netlist_filename)
     output_path = os.path.join(output_dir, output_filename)
 
     
     port_structure = parse_netlist_ports(netlist_path)
 
     
-    with open(user_input_path, 'r') as infile, open(output_path, 'w') as outfile:
+    # Build the whole report as bytes and hand it to the OS in one write
+    line_end = os.linesep.encode()
+    out_buf = bytearray()
+    with open(user_input_path, 'r') as infile:
         for line in infile:
             line = line.strip()
             if not line:
@@ -162,9 +189,77 @@ def main():
             netlist_format = map_to_netlist_format(user_assignments, port_structure)
 
             if netlist_format:
-                outfile.write(netlist_format + '\n')
+                out_buf += netlist_format.encode() + line_end
+
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        view = memoryview(out_buf)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+    return os.path.join('MAPPING_RESULTS', output_filename)
+
+
+def read_batch_file(batch_path):
+    """
+    Each non-empty line of the batch file holds a netlist name and a user input path.
+    The report name comes from the netlist alone, so a netlist may appear only once;
+    otherwise parallel workers would overwrite each other's report.
+    """
+    pairs = []
+    report_lines = {}
+    with open(batch_path, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) != 2:
+                print(f"Error: Malformed batch line: {line.strip()}")
+                sys.exit(1)
+            output_filename = report_filename(fields[0])
+            if output_filename in report_lines:
+                print(f"Error: Batch lines '{report_lines[output_filename]}' and '{line.strip()}' would both write MAPPING_RESULTS/{output_filename}. Map each netlist once per batch.")
+                sys.exit(1)
+            report_lines[output_filename] = line.strip()
+            pairs.append((fields[0], fields[1]))
+    return pairs
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--batch':
+        batch_path = sys.argv[2]
+        if not os.path.exists(batch_path):
+            print(f"Error: Batch file not found: {batch_path}")
+            sys.exit(1)
+
+        pairs = read_batch_file(batch_path)
+        netlist_filenames = [netlist for netlist, _ in pairs]
+        user_input_paths = [user_input for _, user_input in pairs]
+
+        # Every pair is independent, so spread them over worker processes
+        failed = False
+        with ProcessPoolExecutor() as executor:
+            for output_rel_path in executor.map(process_one, netlist_filenames, user_input_paths):
+                if output_rel_path is None:
+                    failed = True
+                else:
+                    print(output_rel_path)
+        if failed:
+            sys.exit(1)
+        return
+
+    if len(sys.argv) != 3:
+        print("Usage: python vector_to_netlist_mapper.py <netlist_json_path> <user_input_txt_path>")
+        print("       python vector_to_netlist_mapper.py --batch <batch_list_txt_path>")
+        sys.exit(1)
+
+    output_rel_path = process_one(sys.argv[1], sys.argv[2])
+    if output_rel_path is None:
+        sys.exit(1)
 
-    print(os.path.join('MAPPING_RESULTS', output_filename))
+    print(output_rel_path)
 
 
 if __name__ == "__main__":
@@ -4,31 +4,410 @@ import copy
 import pyverilog
 import re
 import os
-from pyverilog.vparser.parser import parse
+import hashlib
+import pickle
+import tempfile
+import mmap
+import functools
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pyverilog.vparser.parser import VerilogParser
+from pyverilog.vparser.preprocessor import VerilogPreprocessor
 from pyverilog.vparser import ast as astt
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 
 supported_primitives = {'xor', 'xnor', 'and', 'or', 'nand', 'nor', 'not', 'buf', 'bufif0', 'bufif1', 'notif0', 'notif1'}
-    
-def create_json_netlist(verilog_file_path):
+
+# Direction recorded in the netlist for each port declaration class
+port_direction_names = {astt.Input: 'Input', astt.Output: 'Output', astt.Inout: 'Inout'}
+
+# Parsed ASTs are pickled here, keyed by source content and pyverilog version.
+# PFS_PARSE_CACHE_DIR moves the cache; it must be a directory only the user can write,
+# since cached pickles are loaded (and so executed) on later runs.
+PARSE_CACHE_DIR = os.environ.get('PFS_PARSE_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'pfs_netlist')
+
+# Built on first use; creating the lexer and LALR tables is the costly part of a pyverilog parse
+_verilog_parser = None
+
+def _parse_verilog(verilog_file_path):
+    """
+    Same result as pyverilog's parse([verilog_file_path]), but one VerilogParser
+    is kept per process and reused for every file instead of being rebuilt per call.
+    """
+    global _verilog_parser
+    if _verilog_parser is None:
+        _verilog_parser = VerilogParser()
+    lexer = _verilog_parser.lexer
+    lexer.directives = []
+    lexer.default_nettype = 'wire'
+    lexer.reset_lineno()
+
+    # A private preprocessor output file, so parallel workers never share one
+    fd, preprocess_output = tempfile.mkstemp(suffix='.out')
+    os.close(fd)
+    try:
+        VerilogPreprocessor([verilog_file_path], preprocess_output).preprocess()
+        with open(preprocess_output, encoding='utf-8', errors='surrogateescape') as f:
+            text = f.read()
+    finally:
+        os.remove(preprocess_output)
+
+    ast = _verilog_parser.parse(text)
+    return ast, _verilog_parser.get_directives()
+
+def _load_ast_cached(verilog_file_path):
+    """
+    Returns (ast, directives) for the file, reusing a pickled parse result when
+    the same source was parsed before. Set PFS_NO_PARSE_CACHE to bypass the cache.
+    """
+    if os.environ.get('PFS_NO_PARSE_CACHE'):
+        return _parse_verilog(verilog_file_path)
+
+    key = hashlib.sha256()
+    with open(verilog_file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                key.update(mm)
+    key.update(pyverilog.__version__.encode())
+    key = key.hexdigest()
+    cache_path = os.path.join(PARSE_CACHE_DIR, f"{key}.pkl")
+
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        # Any unreadable entry (truncated, stale, newer pickle protocol) is a cache miss
+        pass
+
+    parsed = _parse_verilog(verilog_file_path)
+
+    # Write to a temporary file first so a concurrent reader never sees a partial pickle
+    tmp_path = None
+    try:
+        os.makedirs(PARSE_CACHE_DIR, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=PARSE_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except (OSError, pickle.PicklingError, RecursionError):
+        # caching is best effort
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return parsed
+
+class Cell:
+    """
+    A cell while the netlist is being built and flattened; turned into a plain
+    {"type": ..., "connections": ...} dict once the netlist is flat.
+    """
+    __slots__ = ('type', 'connections')
+
+    def __init__(self, type, connections):
+        self.type = type
+        self.connections = connections
+
+class FastParseError(Exception):
+    """
+    Raised when the source uses syntax outside the structural subset handled by
+    _fast_structural_parse; callers fall back to the pyverilog parser.
+    """
+    pass
+
+_DIRECTION_CLASSES = {'input': astt.Input, 'output': astt.Output, 'inout': astt.Inout}
+_FAST_UNSUPPORTED_KEYWORDS = {'reg', 'integer', 'real', 'time', 'event', 'logic', 'parameter', 'localparam',
+                              'defparam', 'always', 'initial', 'function', 'task', 'generate', 'genvar',
+                              'specify', 'supply0', 'supply1', 'tri', 'tri0', 'tri1', 'wand', 'wor',
+                              'triand', 'trior', 'trireg', 'pullup', 'pulldown', 'begin', 'end',
+                              'if', 'case', 'for', 'module'}
+
+# Patterns used by the fast structural parser, compiled once at import
+_COMMENT_RE = re.compile(rb'//[^\n]*|/\*.*?\*/', re.S)
+_MODULE_RE = re.compile(r'\bmodule\s+([A-Za-z_]\w*)\s*\((.*?)\)\s*;(.*?)\bendmodule\b', re.S)
+_MODULE_KEYWORD_RE = re.compile(r'\bmodule\b')
+_STATEMENT_RE = re.compile(r'^([A-Za-z_]\w*)\s*(.*)$', re.S)
+_WIRE_KEYWORD_RE = re.compile(r'^wire\b\s*')
+_RANGE_RE = re.compile(r'^\[\s*(\d+)\s*:\s*(\d+)\s*\]$')
+_EXPR_RE = re.compile(r'^([A-Za-z_]\w*)\s*(?:\[\s*(\d+)\s*(?::\s*(\d+)\s*)?\])?$')
+_WIDTH_PREFIX_RE = re.compile(r'^(\[[^\]]*\])\s*(.*)$', re.S)
+_DECL_NAME_RE = re.compile(r'^\s*([A-Za-z_]\w*)\s*(\[[^\]]*\])?\s*$')
+_ANSI_PORT_RE = re.compile(r'^(input|output|inout)\b\s*(wire\b)?\s*(\[[^\]]*\])?\s*(.*)$', re.S)
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_]\w*$')
+_INSTANCE_RE = re.compile(r'^\s*([A-Za-z_]\w*)\s*\((.*)\)\s*$', re.S)
+_NAMED_ARG_RE = re.compile(r'^\s*\.([A-Za-z_]\w*)\s*\((.*)\)\s*$', re.S)
+# Whole module definition with its name captured, scanned straight over the mapped file bytes
+_MODULE_DEF_RE = re.compile(rb'\bmodule\s+(\w+).*?\bendmodule', re.S)
+_TOP_FILE_RE = re.compile(r'^combinatorial_\d+\.v$')
+_WORD_RE = re.compile(r'\b[A-Za-z_]\w*\b')
+
+def _split_top_level(text, sep=','):
+    """
+    Splits text on sep, ignoring separators nested inside (), [] or {}.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for i, ch in enumerate(text):
+        if ch in '([{':
+            depth += 1
+        elif ch in ')]}':
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+def _fast_range(text):
+    """
+    '[msb:lsb]' -> (IntConst msb, IntConst lsb). Only plain decimal bounds are supported.
+    """
+    match = _RANGE_RE.match(text)
+    if not match:
+        raise FastParseError(f"unsupported range '{text}'")
+    return astt.IntConst(match.group(1)), astt.IntConst(match.group(2))
+
+def _fast_expr(text):
+    """
+    Builds the AST for a net reference: name, name[i], name[m:l] or a {...} concatenation.
+    """
+    text = text.strip()
+    if text.startswith('{') and text.endswith('}'):
+        return astt.Concat([_fast_expr(part) for part in _split_top_level(text[1:-1])])
+    match = _EXPR_RE.match(text)
+    if not match:
+        raise FastParseError(f"unsupported expression '{text}'")
+    name, msb, lsb = match.groups()
+    if msb is None:
+        return astt.Identifier(name)
+    if lsb is None:
+        return astt.Pointer(astt.Identifier(name), astt.IntConst(msb))
+    return astt.Partselect(astt.Identifier(name), astt.IntConst(msb), astt.IntConst(lsb))
+
+def _fast_decl_names(text):
+    """
+    Splits 'wire [3:0] a, b[1:0]' style declaration text (keyword already removed)
+    into an optional packed width and a list of (name, dimensions) pairs.
+    """
+    width = None
+    match = _WIDTH_PREFIX_RE.match(text)
+    if match:
+        width = astt.Width(*_fast_range(match.group(1)))
+        text = match.group(2)
+    names = []
+    for part in _split_top_level(text):
+        match = _DECL_NAME_RE.match(part)
+        if not match:
+            raise FastParseError(f"unsupported declaration '{part.strip()}'")
+        dimensions = None
+        if match.group(2):
+            dimensions = astt.Dimensions([astt.Length(*_fast_range(match.group(2)))])
+        names.append((match.group(1), dimensions))
+    return width, names
+
+def _fast_portlist(header):
+    """
+    Module header port list, either ANSI (input [3:0] a, output y) or plain names (a, y).
+    """
+    ports = []
+    if not header.strip():
+        return astt.Portlist(ports)
+    direction = None
+    width = None
+    for part in _split_top_level(header):
+        part = part.strip()
+        is_wire = False
+        match = _ANSI_PORT_RE.match(part)
+        if match:
+            direction = _DIRECTION_CLASSES[match.group(1)]
+            is_wire = match.group(2) is not None
+            width = match.group(3)
+            part = match.group(4)
+        if not _IDENTIFIER_RE.match(part):
+            raise FastParseError(f"unsupported port '{part}'")
+        if direction is None:
+            ports.append(astt.Port(part, None, None, None))
+        else:
+            first = direction(part, astt.Width(*_fast_range(width)) if width else None)
+            second = astt.Wire(part, astt.Width(*_fast_range(width)) if width else None) if is_wire else None
+            ports.append(astt.Ioport(first, second))
+    return astt.Portlist(ports)
+
+def _fast_instances(module_type, text):
+    """
+    'g1 (a, b), g2 (.x(c), .y(d))' -> list of Instance nodes of the given module type.
+    """
+    instances = []
+    for inst_text in _split_top_level(text):
+        match = _INSTANCE_RE.match(inst_text)
+        if not match:
+            raise FastParseError(f"unsupported instance '{inst_text.strip()}'")
+        portlist = []
+        if match.group(2).strip():
+            for arg in _split_top_level(match.group(2)):
+                named = _NAMED_ARG_RE.match(arg)
+                if named:
+                    portlist.append(astt.PortArg(named.group(1), _fast_expr(named.group(2))))
+                else:
+                    portlist.append(astt.PortArg(None, _fast_expr(arg)))
+        instances.append(astt.Instance(module_type, match.group(1), portlist, ()))
+    return instances
+
+def _read_source_without_comments(verilog_file_path):
+    """
+    Memory-maps the source and strips comments on the mapped bytes, so the
+    file is decoded into a str only once, after comment removal.
+    """
+    with open(verilog_file_path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return ''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            source = _COMMENT_RE.sub(b'', mm)
+    # Bytes that are not UTF-8 become surrogates; they never match the parser's
+    # patterns, so such code falls back to pyverilog rather than failing here
+    text = source.decode(errors='surrogateescape')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+def _fast_structural_parse(text):
+    """
+    Regex/hand-written parser for the structural Verilog subset used by this tool
+    (port and wire declarations, gate/module instances and net-only assigns).
+    Expects source text with comments already removed (see _read_source_without_comments).
+    Produces the same pyverilog AST classes as parse(), without running PLY.
+    Raises FastParseError on anything outside that subset.
+    """
+    if '`' in text or '#' in text:
+        raise FastParseError("compiler directives and parameters are not supported")
+
+    module_defs = []
+    for module_match in _MODULE_RE.finditer(text):
+        module_name, header, body = module_match.groups()
+        items = []
+        for statement in body.split(';'):
+            statement = statement.strip()
+            if not statement:
+                continue
+            match = _STATEMENT_RE.match(statement)
+            if not match:
+                raise FastParseError(f"unsupported statement '{statement}'")
+            keyword, rest = match.groups()
+            if keyword in _DIRECTION_CLASSES:
+                is_wire = _WIRE_KEYWORD_RE.match(rest)
+                if is_wire:
+                    rest = rest[is_wire.end():]
+                width, names = _fast_decl_names(rest)
+                decl_list = []
+                for name, dimensions in names:
+                    decl_list.append(_DIRECTION_CLASSES[keyword](name, width, dimensions=dimensions))
+                    if is_wire:
+                        decl_list.append(astt.Wire(name, width, dimensions=dimensions))
+                items.append(astt.Decl(decl_list))
+            elif keyword == 'wire':
+                width, names = _fast_decl_names(rest)
+                items.append(astt.Decl([astt.Wire(name, width, dimensions=dimensions) for name, dimensions in names]))
+            elif keyword == 'assign':
+                sides = rest.split('=')
+                if len(sides) != 2:
+                    raise FastParseError(f"unsupported assign '{statement}'")
+                items.append(astt.Assign(astt.Lvalue(_fast_expr(sides[0])), astt.Rvalue(_fast_expr(sides[1]))))
+            elif keyword in _FAST_UNSUPPORTED_KEYWORDS:
+                raise FastParseError(f"unsupported statement '{statement}'")
+            else:
+                items.append(astt.InstanceList(keyword, (), _fast_instances(keyword, rest)))
+        module_defs.append(astt.ModuleDef(module_name, astt.Paramlist(()), _fast_portlist(header), items))
+
+    if len(module_defs) != len(_MODULE_KEYWORD_RE.findall(text)):
+        raise FastParseError("unsupported module header")
+
+    return astt.Source('', astt.Description(module_defs))
+
+def _vector_bit_names(name, msb, lsb):
+    """
+    Per-bit net names of vector `name`, listed from the lsb index towards the msb
+    (a0, a1, a2 for [2:0]). An [n:n] range yields no names.
+    """
+    if msb > lsb:
+        indices = range(lsb, msb + 1)
+    elif lsb > msb:
+        indices = range(lsb, msb - 1, -1)
+    else:
+        return []
+    # Two-part names are cheaper to build by concatenation than through an f-string
+    intern = sys.intern
+    return [intern(name + str(i)) for i in indices]
+
+def net_name(argname):
+    """
+    Flat net name of a primitive terminal: a scalar identifier or one bit of a vector.
+    """
+    if isinstance(argname, astt.Identifier):
+        return sys.intern(argname.name)
+    return sys.intern(f"{argname.var.name}{argname.ptr.value}")
+
+def primitive_connections(portlist):
+    """
+    Connections of a gate primitive; the first terminal is the output, the rest are inputs.
+    """
+    return {"inputs": [net_name(port_conn.argname) for port_conn in portlist[1:]],
+            "outputs": [net_name(portlist[0].argname)]}
+
+def create_json_netlist(verilog_file_path, strict=False, sort_nets=False):
     """
     Parses a structural Verilog file and creates a JSON netlist.
+    The fast structural parser is tried first unless strict is set;
+    pyverilog is used when strict is set or the fast parser gives up.
+    Nets are listed in discovery order unless sort_nets is set.
     """
-    ast, directives = parse([verilog_file_path])
+    # Net and type names repeat across many cells, so they are interned at ingest
+    intern = sys.intern
+    ast = None
+    if not strict:
+        try:
+            ast = _fast_structural_parse(_read_source_without_comments(verilog_file_path))
+        except FastParseError:
+            ast = None
+    if ast is None:
+        ast, directives = _load_ast_cached(verilog_file_path)
     netlist = {"modules": {}}
 
     module_port_info = {}
-    all_module_defs = [m for m in ast.children()[0].children() if m.__class__.__name__=='ModuleDef']
+    module_port_index = {}  # module name : {port bit name : position in module_port_info}
+    all_module_defs = [m for m in ast.children()[0].children() if isinstance(m, astt.ModuleDef)]
     all_vectors = {}  # vector_name : [msb,lsb]
+    all_bit_names = {}  # vector_name : per-bit net names, built once per vector
+    module_assign_items = {}  # module name : its assign statements, for analyze_fanouts
 
     for m_def in all_module_defs:
         m_name = m_def.name
         ports = {}
         all_vectors[m_name] = {}
+        all_bit_names[m_name] = {}
+        # One pass over the items: first declaration of each name, for the non-ANSI
+        # port lookup below, and the assign statements
+        decls_by_name = {}
+        assign_items = module_assign_items[m_name] = []
+        for item in m_def.items:
+            if isinstance(item, astt.Decl):
+                for decl in item.list:
+                    decls_by_name.setdefault(decl.name, decl)
+            elif isinstance(item, astt.Assign):
+                assign_items.append(item)
         for port in m_def.portlist.ports:
             port_name = []
             port_direction = None
-            if type(port).__name__ == 'Ioport':  # module m(input [2:0]x, output y);
+            if isinstance(port, astt.Ioport):  # module m(input [2:0]x, output y);
                 port_obj = port.first
                 pname = port_obj.name
                 if port_obj.width is None :
@@ -37,69 +416,65 @@ def create_json_netlist(verilog_file_path):
                     lsb = int(str(port_obj.width.lsb))
                     msb = int(str(port_obj.width.msb))
                     all_vectors[m_name][pname] = [msb,lsb]
-                    if msb > lsb :
-                        for p in range(lsb, msb+1):
-                            port_name.append(f"{pname}{p}")
-                    elif lsb > msb :
-                        for p in range(lsb,msb-1,-1):
-                            port_name.append(f"{pname}{p}")
-                port_direction = type(port_obj).__name__
+                    all_bit_names[m_name][pname] = _vector_bit_names(pname, msb, lsb)
+                    port_name.extend(all_bit_names[m_name][pname])
+                port_direction = port_direction_names[type(port_obj)]
             else:   # module m(x,y);  input [2:0]x; output y;
                 pname = port.name
-                for item in m_def.items:
-                    if isinstance(item, pyverilog.vparser.ast.Decl):
-                        for decl in item.list:
-                            if decl.name == port.name:
-                                if decl.width == None and decl.dimensions == None:
-                                    port_name.append(pname)
-                                    port_direction = type(decl).__name__
-                                    break
-                                else:
-                                    lsb = None
-                                    msb = None
-                                    if decl.width is not None:
-                                        lsb = int(decl.width.lsb.value)
-                                        msb = int(decl.width.msb.value)
-                                    elif decl.dimensions is not None:
-                                        lsb = int(decl.dimensions.lengths[0].lsb.value)
-                                        msb = int(decl.dimensions.lengths[0].msb.value)
-                                    all_vectors[m_name][pname] = [msb,lsb]
-                                    if msb > lsb :
-                                        for p in range(lsb, msb+1):
-                                            port_name.append(f"{pname}{p}")
-                                    elif lsb > msb :
-                                        for p in range(lsb, msb-1, -1):
-                                            port_name.append(f"{pname}{p}")
-                                    port_direction = type(decl).__name__
-                    if port_direction:
-                        break
+                decl = decls_by_name.get(pname)
+                if decl is not None:
+                    if decl.width == None and decl.dimensions == None:
+                        port_name.append(pname)
+                    else:
+                        lsb = None
+                        msb = None
+                        if decl.width is not None:
+                            lsb = int(decl.width.lsb.value)
+                            msb = int(decl.width.msb.value)
+                        elif decl.dimensions is not None:
+                            lsb = int(decl.dimensions.lengths[0].lsb.value)
+                            msb = int(decl.dimensions.lengths[0].msb.value)
+                        all_vectors[m_name][pname] = [msb,lsb]
+                        all_bit_names[m_name][pname] = _vector_bit_names(pname, msb, lsb)
+                        port_name.extend(all_bit_names[m_name][pname])
+                    port_direction = port_direction_names.get(type(decl)) or type(decl).__name__
             if port_name and port_direction:
                 for p in port_name:
-                    ports[p] = port_direction
+                    ports[intern(p)] = port_direction
         module_port_info[m_name] = ports
+        module_port_index[m_name] = {port: index for index, port in enumerate(ports)}
     
+    module_nets = {}
+    module_input_locations = {}  # module name : {net : [(cell name, input index), ...]}
     for module_def in all_module_defs:
         module_name = module_def.name
     
-        netlist["modules"][module_name] = { 
+        module_out = netlist["modules"][module_name] = { 
             "ports": {},
             "cells": {},
             "nets": [],
-            "fanouts":{}
+            "fanouts":{},
+            "sub_instances": []  # names of user-module instances, for flatten_netlist; not written out
         }
+        ports_out = module_out["ports"]
+        cells_out = module_out["cells"]
+        sub_instances = module_out["sub_instances"]
+        module_ports = module_port_info[module_name]
+        module_vectors = all_vectors[module_name]
+        module_bit_names = all_bit_names[module_name]
 
-        all_nets = set()
-        for port in module_port_info[module_name] :
-            direction = module_port_info[module_name].get(port)
-            netlist["modules"][module_name]["ports"][port] = {"direction": direction}
-            all_nets.add(port)
+        all_nets = {}  # insertion-ordered set of net names (values unused)
+        input_locations = module_input_locations[module_name] = defaultdict(list)
+        for port, direction in module_ports.items():
+            ports_out[port] = {"direction": direction}
+            all_nets[port] = None
 
         for item in module_def.items:
-            if item.__class__.__name__ == 'Decl':
+            if isinstance(item, astt.Decl):
                 for declaration in item.list:
-                    if declaration.name not in module_port_info[module_name]:
+                    if declaration.name not in module_ports:
                         if declaration.dimensions is None and declaration.width is None:
-                            all_nets.add(declaration.name)
+                            all_nets[intern(declaration.name)] = None
                         else:
                             lsb = None
                             msb = None
@@ -110,64 +485,39 @@ def create_json_netlist(verilog_file_path):
                             elif declaration.width is not None:
                                 lsb = int(declaration.width.lsb.value)
                                 msb = int(declaration.width.msb.value)
-                            all_vectors[module_name][declaration.name] = [msb,lsb]
-                            if msb > lsb :
-                                for l in range(lsb, msb+1):
-                                    all_nets.add(f"{declaration.name}{l}")
-                            elif lsb > msb :
-                                for l in range(lsb, msb-1,-1):
-                                    all_nets.add(f"{declaration.name}{l}")
+                            module_vectors[declaration.name] = [msb,lsb]
+                            module_bit_names[declaration.name] = _vector_bit_names(declaration.name, msb, lsb)
+                            for bit_name in module_bit_names[declaration.name]:
+                                all_nets[bit_name] = None
     
-            elif item.__class__.__name__ == 'InstanceList':
+            elif isinstance(item, astt.InstanceList):
                 for instance in item.instances:
                     instance_name = instance.name
-                    instance_type = instance.module
+                    instance_type = intern(instance.module)
                     connections = {"inputs": [], "outputs": []}
 
                     if instance_type in supported_primitives:
                         if instance.portlist:
-                            if hasattr(instance.portlist[0].argname,'name'):
-                                connections["outputs"].append(instance.portlist[0].argname.name)
-                            else:
-                                connections["outputs"].append(f"{instance.portlist[0].argname.var.name}{instance.portlist[0].argname.ptr.value}")
-                            for port_conn in instance.portlist[1:]:
-                                if hasattr(port_conn.argname,'name'):
-                                    connections["inputs"].append(port_conn.argname.name)
-                                else:
-                                    connections["inputs"].append(f"{port_conn.argname.var.name}{port_conn.argname.ptr.value}")
+                            connections = primitive_connections(instance.portlist)
 
                     
                     elif instance_type in module_port_info:
                         formal_module_ports = module_port_info[instance_type]
                         actual_module_ports = []
                         for port_conn in instance.portlist:
-                            if hasattr(port_conn.argname,'name') and port_conn.argname.name not in all_vectors[module_name]:
-                                port_name = port_conn.argname.name
-                                actual_module_ports.append(port_name)
-                            elif hasattr(port_conn.argname,'name') and port_conn.argname.name in all_vectors[module_name]:
-                                port_name = port_conn.argname.name
-                                msb = all_vectors[module_name][port_name][0]
-                                lsb = all_vectors[module_name][port_name][1]
-                                if msb > lsb :
-                                    for i in range(lsb,msb+1):
-                                        actual_module_ports.append(f"{port_name}{i}")
-                                elif lsb > msb :
-                                    for i in range(lsb,msb-1,-1):
-                                        actual_module_ports.append(f"{port_name}{i}")
-                            elif hasattr(port_conn.argname,'ptr'):
-                                port_name = f"{port_conn.argname.var.name}{port_conn.argname.ptr.value}"
-                                actual_module_ports.append(port_name)
+                            argname = port_conn.argname
+                            arg_name = getattr(argname, 'name', None)
+                            if arg_name is not None and arg_name not in module_vectors:
+                                actual_module_ports.append(intern(arg_name))
+                            elif arg_name is not None:
+                                actual_module_ports.extend(module_bit_names[arg_name])
+                            elif hasattr(argname,'ptr'):
+                                port_name = f"{argname.var.name}{argname.ptr.value}"
+                                actual_module_ports.append(intern(port_name))
                             else:
-                                lsb = int(str(port_conn.argname.lsb))
-                                msb = int(str(port_conn.argname.msb))
-                                if msb > lsb :
-                                    for p in range(lsb, msb+1):
-                                        port_name = f"{port_conn.argname.var.name}{p}"
-                                        actual_module_ports.append(port_name)
-                                elif lsb > msb :
-                                    for p in range(lsb, msb-1, -1):
-                                        port_name = f"{port_conn.argname.var.name}{p}"
-                                        actual_module_ports.append(port_name)
+                                lsb = int(str(argname.lsb))
+                                msb = int(str(argname.msb))
+                                actual_module_ports.extend(_vector_bit_names(argname.var.name, msb, lsb))
 
                         if instance.portlist[0].portname is not None:
                             actual_port_mappings = {}
@@ -175,23 +525,18 @@ def create_json_netlist(verilog_file_path):
                             index = 0
                             for port_conn in instance.portlist:
                                 actual_port = port_conn.portname
-                                if actual_port not in all_vectors[instance_type]:
+                                if actual_port not in all_bit_names[instance_type]:
                                     actual_port_mappings[actual_port] = actual_module_ports[index]
                                     index = index + 1
                                 else:
-                                    [msb,lsb] = all_vectors[instance_type][actual_port]
-                                    if msb > lsb :
-                                        for i in range(msb,lsb-1,-1):
-                                            actual_port_mappings[f"{actual_port}{i}"] = actual_module_ports[index]
-                                            index = index + 1
-                                    elif msb < lsb :
-                                        for i in range(msb,lsb+1):
-                                            actual_port_mappings[f"{actual_port}{i}"] = actual_module_ports[index]
-                                            index = index + 1
+                                    # formal vector bits are connected msb first
+                                    for bit_name in reversed(all_bit_names[instance_type][actual_port]):
+                                        actual_port_mappings[bit_name] = actual_module_ports[index]
+                                        index = index + 1
                             
+                            formal_port_index = module_port_index[instance_type]
                             for actual_port in actual_port_mappings:
-                                index = list(formal_module_ports.keys()).index(actual_port)
-                                actual_module_ports[index] = actual_port_mappings[actual_port]
+                                actual_module_ports[formal_port_index[actual_port]] = actual_port_mappings[actual_port]
                          
                         i = 0
                         for formal_port in formal_module_ports:
@@ -205,238 +550,175 @@ def create_json_netlist(verilog_file_path):
                     else:
                          print(f"Warning: Module definition for '{instance_type}' not found.")
 
-                    for net in connections.get('inputs', []):
-                        all_nets.add(net)
+                    if instance_type not in supported_primitives:
+                        sub_instances.append(instance_name)
+
+                    for input_index, net in enumerate(connections.get('inputs', [])):
+                        all_nets[net] = None
+                        input_locations[net].append((instance_name, input_index))
                     for net in connections.get('outputs', []):
-                        all_nets.add(net)
+                        all_nets[net] = None
 
-                    netlist["modules"][module_name]["cells"][instance_name] = {
-                        "type": instance_type,
-                        "connections": connections
-                    }
+                    cells_out[instance_name] = Cell(instance_type, connections)
         
-        netlist["modules"][module_name]["nets"] = sorted(list(all_nets))
+        # Kept as a dict until analyze_fanouts has added its nets; "nets" is filled in once below
+        module_nets[module_name] = all_nets
     
     for module_def in all_module_defs:
         module_name = module_def.name
         vector_list = all_vectors[module_name]
-        final_nets = analyze_fanouts(module_def,netlist,module_name,set(netlist["modules"][module_name]["nets"]),vector_list)
-        netlist['modules'][module_name]['nets'] = sorted(list(final_nets))
+        final_nets = analyze_fanouts(module_assign_items[module_name],netlist,module_name,module_nets[module_name],vector_list,module_input_locations[module_name])
+        netlist['modules'][module_name]['nets'] = sorted(final_nets) if sort_nets else list(final_nets)
     
     flattened_netlist = flatten_netlist(netlist)
+    for module in flattened_netlist.values():
+        module['cells'] = {name: {"type": cell.type, "connections": cell.connections} for name, cell in module['cells'].items()}
     return flattened_netlist
 
-def analyze_fanouts(module_def,netlist,module_name,all_nets,vector_list):
-
-    for item in module_def.items:
-        if isinstance(item, astt.Assign):
-            lhs = item.left.var
-            # Check for implicit scalar wire (e.g., assign x = y;)
-            if hasattr(lhs, 'name'):
-                net_name = lhs.name
-                if net_name not in all_nets and net_name not in vector_list:
-                    all_nets.add(net_name)
-            # Check for implicit vector wire (e.g., assign x[1:0] = y;)
-            elif hasattr(lhs, 'var'):
-                net_name = lhs.var.name
-                if net_name not in vector_list:
-                    msb = int(lhs.msb.value)
-                    lsb = int(lhs.lsb.value)
-                    vector_list[net_name] = [msb, lsb]
-                    # Add all individual bits of the new vector to the net list
-                    if msb > lsb:
-                        for i in range(lsb, msb + 1):
-                            all_nets.add(f"{net_name}{i}")
-                    else:  # lsb > msb
-                        for i in range(lsb, msb - 1, -1):
-                            all_nets.add(f"{net_name}{i}")
+def _bit_iter(msb, lsb):
+    """
+    Bit indices of a [msb:lsb] range, from msb to lsb in either declaration order.
+    """
+    step = 1 if msb < lsb else -1
+    return range(msb, lsb + step, step)
+
+def analyze_fanouts(assign_items,netlist,module_name,all_nets,vector_list,input_locations):
+    """
+    Records assign fanouts, splits cell inputs that share a net into branches
+    and folds single-branch stems back. assign_items are the module's assign
+    statements and input_locations the net -> cell input index, both collected
+    while the module was built.
+    """
+    # Assign-derived names are interned like the cell connections they refer to,
+    # so a net name is held once however many fanout entries mention it
+    intern = sys.intern
+
+    for item in assign_items:
+        lhs = item.left.var
+        # Check for implicit scalar wire (e.g., assign x = y;)
+        if hasattr(lhs, 'name'):
+            net_name = lhs.name
+            if net_name not in all_nets and net_name not in vector_list:
+                all_nets[intern(net_name)] = None
+        # Check for implicit vector wire (e.g., assign x[1:0] = y;)
+        elif hasattr(lhs, 'var'):
+            net_name = lhs.var.name
+            if net_name not in vector_list:
+                msb = int(lhs.msb.value)
+                lsb = int(lhs.lsb.value)
+                vector_list[net_name] = [msb, lsb]
+                # Add all individual bits of the new vector to the net list, lsb first
+                all_nets.update(dict.fromkeys([intern(net_name + str(i)) for i in _bit_iter(lsb, msb)]))
         
-    for item in module_def.items:
-        if isinstance(item, astt.Assign):
-            #branch = item.left.var.name
-            if hasattr(item.right.var,'name'):
-                stem = item.right.var.name
-                if stem not in vector_list:
-                    branch = item.left.var.name
-                    if stem not in netlist["modules"][module_name]["fanouts"]:
-                        netlist["modules"][module_name]["fanouts"][stem] = [branch]
-                    else:
-                        netlist["modules"][module_name]["fanouts"][stem].append(branch)
-                else:
-                    [s_msb,s_lsb] = vector_list[stem]
-                    [b_msb,b_lsb] = [None, None]
-                    branch = None
-                    if hasattr(item.left.var,'name'):
-                        branch = item.left.var.name
-                        [b_msb,b_lsb] = vector_list[branch]
-                    elif hasattr(item.left.var,'var'):
-                        branch = item.left.var.var.name
-                        [b_msb,b_lsb] = [int(item.left.var.msb.value),int(item.left.var.lsb.value)]
-                        
-                    if s_msb > s_lsb and b_msb > b_lsb:
-                        j = b_msb
-                        for i in range(s_msb,s_lsb-1,-1):
-                            if f"{stem}{i}" not in netlist["modules"][module_name]["fanouts"]:
-                                netlist["modules"][module_name]["fanouts"][f"{stem}{i}"] = [f"{branch}{j}"]
-                            else:
-                                netlist["modules"][module_name]["fanouts"][f"{stem}{i}"].append([f"{branch}{j}"])
-                            j = j-1
-                    elif s_msb < s_lsb and b_msb > b_lsb :
-                        j = b_msb
-                        for i in range(s_msb,s_lsb+1):
-                            if f"{stem}{i}" not in netlist["modules"][module_name]["fanouts"]:
-                                netlist["modules"][module_name]["fanouts"][f"{stem}{i}"] = [f"{branch}{j}"]
-                            else:
-                                netlist["modules"][module_name]["fanouts"][f"{stem}{i}"].append([f"{branch}{j}"])
-                            j = j-1
-                    elif s_msb > s_lsb and b_msb < b_lsb :
-                        j = b_msb
-                        for i in range(s_msb,s_lsb-1,-1):
-                            if f"{stem}{i}" not in netlist["modules"][module_name]["fanouts"]:
-                                netlist["modules"][module_name]["fanouts"][f"{stem}{i}"] = [f"{branch}{j}"]
-                            else:
-                                netlist["modules"][module_name]["fanouts"][f"{stem}{i}"].append([f"{branch}{j}"])
-                            j = j+1
-                    elif s_msb < s_lsb and b_msb < b_lsb :
-                        j = b_msb
-                        for i in range(s_msb,s_lsb+1):
-                            if f"{stem}{i}" not in netlist["modules"][module_name]["fanouts"]:
-                                netlist["modules"][module_name]["fanouts"][f"{stem}{i}"] = [f"{branch}{j}"]
-                            else:
-                                netlist["modules"][module_name]["fanouts"][f"{stem}{i}"].append([f"{branch}{j}"])
-                            j = j+1
-            elif hasattr(item.right.var,'var'):
-                stem = item.right.var.var.name
-                [s_msb, s_lsb] = [int(item.right.var.msb.value),int(item.right.var.lsb.value)]
-                [b_msb, b_lsb] = [None, None]
-                branch = None
-                if hasattr(item.left.var,'name'):
-                    branch = item.left.var.name
-                    [b_msb,b_lsb] = vector_list[branch]
-                elif hasattr(item.left.var,'var'):
-                    branch = item.left.var.var.name
-                    [b_msb,b_lsb] = [int(item.left.var.msb.value),int(item.left.var.lsb.value)]
-                        
-                if s_msb > s_lsb and b_msb > b_lsb:
-                    j = b_msb
-                    for i in range(s_msb,s_lsb-1,-1):
-                        if f"{stem}{i}" not in netlist["modules"][module_name]["fanouts"]:
-                            netlist["modules"][module_name]["fanouts"][f"{stem}{i}"] = [f"{branch}{j}"]
-                        else:
-                            netlist["modules"][module_name]["fanouts"][f"{stem}{i}"].append([f"{branch}{j}"])
-                        j = j-1
-                elif s_msb < s_lsb and b_msb > b_lsb :
-                    j = b_msb
-                    for i in range(s_msb,s_lsb+1):
-                        if f"{stem}{i}" not in netlist["modules"][module_name]["fanouts"]:
-                            netlist["modules"][module_name]["fanouts"][f"{stem}{i}"] = [f"{branch}{j}"]
-                        else:
-                            netlist["modules"][module_name]["fanouts"][f"{stem}{i}"].append([f"{branch}{j}"])
-                        j = j-1
-                elif s_msb > s_lsb and b_msb < b_lsb :
-                    j = b_msb
-                    for i in range(s_msb,s_lsb-1,-1):
-                        if f"{stem}{i}" not in netlist["modules"][module_name]["fanouts"]:
-                            netlist["modules"][module_name]["fanouts"][f"{stem}{i}"] = [f"{branch}{j}"]
-                        else:
-                            netlist["modules"][module_name]["fanouts"][f"{stem}{i}"].append([f"{branch}{j}"])
-                        j = j+1
-                elif s_msb < s_lsb and b_msb < b_lsb :
-                    j = b_msb
-                    for i in range(s_msb,s_lsb+1):
-                        if f"{stem}{i}" not in netlist["modules"][module_name]["fanouts"]:
-                            netlist["modules"][module_name]["fanouts"][f"{stem}{i}"] = [f"{branch}{j}"]
-                        else:
-                            netlist["modules"][module_name]["fanouts"][f"{stem}{i}"].append([f"{branch}{j}"])
-                        j = j+1
-
-            elif hasattr(item.right.var,'list'):
-                stem = []
-                for l in item.right.var.list:
-                    if hasattr(l,'name'):
-                        if l.name not in vector_list:
-                            stem.append(l.name)
-                        else:
-                            [msb,lsb] = vector_list[l.name]
-                            if msb > lsb :
-                                for i in range(msb, lsb-1, -1):
-                                    stem.append(f"{l.name}{i}")
-                            elif msb < lsb :
-                                for i in range(msb,lsb+1):
-                                    stem.append(f"{l.name}{i}")
-                    elif hasattr(l,'var'):
-                        mb = int(l.msb.value)
-                        lb = int(l.lsb.value)
-                        if mb > lb :
-                            for i in range(mb, lb-1, -1):
-                                stem.append(f"{l.var.name}{i}")
-                        elif mb < lb :
-                            for i in range(mb,lb+1):
-                                stem.append(f"{l.var.name}{i}")
-                
-                [b_msb, b_lsb] = [None, None]
-                branch = None
-                if hasattr(item.left.var,'name'):
-                    [b_msb, b_lsb] = vector_list[item.left.var.name]
-                    branch = item.left.var.name
-                elif hasattr(item.left.var,'var'):
-                    [b_msb, b_lsb] = [int(item.left.var.msb.value),int(item.left.var.lsb.value)]
-                    branch = item.left.var.var.name
-
-                index = b_msb
-                for i in range(len(stem)-1,-1,-1):
-                    if stem[i] not in netlist["modules"][module_name]["fanouts"]:
-                        netlist["modules"][module_name]["fanouts"][stem[i]] = [f"{branch}{index}"]
-                    else:
-                        netlist["modules"][module_name]["fanouts"][stem[i]].append(f"{branch}{index}")
-                    if b_msb > b_lsb:
-                        index = index - 1
-                    elif b_msb < b_lsb :
-                        index = index + 1
+    # Collected locally, then stored on the module once the redundant stems are gone
+    fanouts = defaultdict(list)
+
+    for item in assign_items:
+        # Probe each side's node shape once: Identifier has a name, Partselect a var, Concat a list
+        lhs = item.left.var
+        rhs = item.right.var
+        lhs_name = getattr(lhs, 'name', None)
+        lhs_var = getattr(lhs, 'var', None)
+        rhs_name = getattr(rhs, 'name', None)
+        rhs_var = getattr(rhs, 'var', None)
+        rhs_list = getattr(rhs, 'list', None)
+
+        if rhs_name is not None and rhs_name not in vector_list:
+            fanouts[intern(rhs_name)].append(intern(lhs.name))
+            continue
+        if rhs_name is None and rhs_var is None and rhs_list is None:
+            continue
+
+        [b_msb,b_lsb] = [None, None]
+        branch = None
+        if lhs_name is not None:
+            branch = lhs_name
+            [b_msb,b_lsb] = vector_list[branch]
+        elif lhs_var is not None:
+            branch = lhs_var.name
+            [b_msb,b_lsb] = [int(lhs.msb.value),int(lhs.lsb.value)]
 
-    module_cells = netlist["modules"][module_name]["cells"]
-    input_counter = {}
-    input_locations = {}
+        if rhs_name is not None or rhs_var is not None:
+            if rhs_name is not None:
+                stem = rhs_name
+                [s_msb,s_lsb] = vector_list[stem]
+            else:
+                stem = rhs_var.name
+                [s_msb, s_lsb] = [int(rhs.msb.value),int(rhs.lsb.value)]
 
-    for cell_name,cell_info in module_cells.items():
-        cell_inputs = cell_info.get('connections', {}).get('inputs', [])
-        for i, input_net in enumerate(cell_inputs):
-            input_counter[input_net] = input_counter.get(input_net, 0) + 1
-            input_locations.setdefault(input_net, []).append((cell_name, i))
+            # Stem and branch bits are paired msb first, whatever the direction of each range
+            if s_msb != s_lsb and b_msb != b_lsb:
+                for i, j in zip(_bit_iter(s_msb, s_lsb), _bit_iter(b_msb, b_lsb)):
+                    fanouts[intern(stem + str(i))].append(intern(branch + str(j)))
 
-    fanout_nets = [net for net, count in input_counter.items() if count >= 2]
+        else:
+            stem = []
+            for l in rhs_list:
+                l_name = getattr(l, 'name', None)
+                if l_name is not None:
+                    if l_name not in vector_list:
+                        stem.append(intern(l_name))
+                    else:
+                        [msb,lsb] = vector_list[l_name]
+                        stem.extend(reversed(_vector_bit_names(l_name, msb, lsb)))
+                elif hasattr(l,'var'):
+                    mb = int(l.msb.value)
+                    lb = int(l.lsb.value)
+                    stem.extend(reversed(_vector_bit_names(l.var.name, mb, lb)))
+
+            index = b_msb
+            for i in range(len(stem)-1,-1,-1):
+                fanouts[stem[i]].append(intern(branch + str(index)))
+                if b_msb > b_lsb:
+                    index = index - 1
+                elif b_msb < b_lsb :
+                    index = index + 1
+
+    module_out = netlist["modules"][module_name]
+    module_cells = module_out["cells"]
+    fanout_nets = [net for net, locations in input_locations.items() if len(locations) >= 2]
 
     for fanout_net in fanout_nets:
         locations = input_locations[fanout_net]
         new_branch_names = []
-        for i, (cell_name, input_index) in enumerate(locations):
-            branch_id = i + 1
+        for branch_id, (cell_name, input_index) in enumerate(locations, 1):
             new_name = f"{fanout_net}_{branch_id}"
             new_branch_names.append(new_name)
-            netlist["modules"][module_name]['cells'][cell_name]['connections']['inputs'][input_index] = new_name
-            if new_name not in all_nets:
-                all_nets.add(new_name)
+            module_cells[cell_name].connections['inputs'][input_index] = new_name
+            all_nets[new_name] = None
         
-        netlist["modules"][module_name]['fanouts'][fanout_net] = new_branch_names
+        fanouts[fanout_net] = new_branch_names
 
     redundant_nets={} #dict which stores redundant net : net which will replace redundant net
     redundant_fanout_stems=[] #list to store redundant fanout stems (which only have one branch)
 
-    for stem,branches in netlist["modules"][module_name]["fanouts"].items():
+    for stem,branches in fanouts.items():
         if(len(branches)==1):
             redundant_nets[branches[0]]=stem 
             redundant_fanout_stems.append(stem)
         
-    for module_cell in netlist["modules"][module_name]["cells"].values():
-        cell_inputs = module_cell['connections']['inputs']
-        new_cell_inputs = [redundant_nets.get(net,net) for net in cell_inputs]
-        module_cell['connections']['inputs'] = new_cell_inputs
+    # Only the inputs that still read a redundant net need rewriting; a fanout net's
+    # recorded locations were already renamed to its branches above
+    for redundant_net, replacement in redundant_nets.items():
+        for cell_name, input_index in input_locations.get(redundant_net, ()):
+            cell_inputs = module_cells[cell_name].connections['inputs']
+            if cell_inputs[input_index] == redundant_net:
+                cell_inputs[input_index] = replacement
 
     for stem in redundant_fanout_stems:
-        del netlist["modules"][module_name]['fanouts'][stem]
+        del fanouts[stem]
+    module_out["fanouts"] = dict(fanouts)
         
-    updated_nets_set = all_nets - redundant_nets.keys()
-    return updated_nets_set
+    # Dropped in place: usually only a few nets are redundant, and the rest keep their order
+    for redundant_net in redundant_nets:
+        all_nets.pop(redundant_net, None)
+    return all_nets
+
+def _clone_cell(cell):
+    """
+    Copy of a cell with fresh connection lists, the only parts flattening mutates.
+    """
+    return Cell(cell.type, {"inputs": list(cell.connections["inputs"]), "outputs": list(cell.connections["outputs"])})
 
 def flatten_netlist(netlist_dict):
     """
@@ -446,24 +728,34 @@ def flatten_netlist(netlist_dict):
     modules = netlist_dict['modules']
     top_module_name = next(iter(modules))
     
-    # Create a deep copy of the top module to work on
-    flattened_module = json.loads(json.dumps(modules[top_module_name]))
+    # Copy the top module to work on; only the containers that get mutated are rebuilt
+    top_module = modules[top_module_name]
+    flattened_module = {
+        'ports': {port: dict(port_data) for port, port_data in top_module['ports'].items()},
+        'cells': {cell_name: _clone_cell(cell) for cell_name, cell in top_module['cells'].items()},
+        'nets': dict.fromkeys(top_module['nets']),  # insertion-ordered set while flattening
+        'fanouts': {stem: list(branches) for stem, branches in top_module['fanouts'].items()}
+    }
 
-    # Loop until no more user-defined submodules are found
-    while True:
-        instance_to_flatten = None
-        # Find the first cell that is an instance of a user-defined module
-        for instance_name, cell_data in flattened_module['cells'].items():
-            if cell_data['type'] not in supported_primitives:
-                instance_to_flatten = (instance_name, cell_data)
-                break
-        
-        # If no submodule instances are left, the netlist is flat
-        if not instance_to_flatten:
-            break
+    # The containers are bound once; they are written for every copied cell and net
+    flat_cells = flattened_module['cells']
+    flat_nets = flattened_module['nets']
+    flat_fanouts = flattened_module['fanouts']
+
+    # Work queue of user-defined submodule instances still to expand, in cell order,
+    # seeded from the instance lists recorded while the modules were built.
+    # Cells added by an expansion go to the back, so the netlist is flat once it is empty.
+    pending = deque(top_module['sub_instances'])
 
-        instance_name, instance_data = instance_to_flatten
-        module_type = instance_data['type']
+    # module type -> (input ports, output ports), computed on its first expansion
+    port_cache = {}
+
+    while pending:
+        instance_name = pending.popleft()
+        instance_data = flat_cells.get(instance_name)
+        if instance_data is None:
+            continue
+        module_type = instance_data.type
         
         if module_type not in modules:
             raise ValueError(f"Module definition for type '{module_type}' not found.")
@@ -473,36 +765,41 @@ def flatten_netlist(netlist_dict):
         # --- 1. Create a map from submodule's local net names to global names ---
         net_map = {}
 
-        # Map ports by connecting them to the nets specified in the instance
-        # Sorting ensures a deterministic order for port connections
-        sub_input_ports = [p for p, d in submodule_def['ports'].items() if d['direction'] == 'Input']
-        sub_output_ports = [p for p, d in submodule_def['ports'].items() if d['direction'] == 'Output']
+        # Map ports by connecting them to the nets specified in the instance,
+        # positionally in port declaration order
+        if module_type not in port_cache:
+            port_cache[module_type] = (
+                [p for p, d in submodule_def['ports'].items() if d['direction'] == 'Input'],
+                [p for p, d in submodule_def['ports'].items() if d['direction'] == 'Output']
+            )
+        sub_input_ports, sub_output_ports = port_cache[module_type]
         
         for i, port_name in enumerate(sub_input_ports):
-            net_map[port_name] = instance_data['connections']['inputs'][i]
+            net_map[port_name] = instance_data.connections['inputs'][i]
         
         for i, port_name in enumerate(sub_output_ports):
-            net_map[port_name] = instance_data['connections']['outputs'][i]
+            net_map[port_name] = instance_data.connections['outputs'][i]
 
         # Map internal nets by prefixing them with the instance name
         for net_name in submodule_def['nets']:
             if net_name not in net_map:  # If it's not a port, it's an internal net
                 new_net_name = f"{instance_name}_{net_name}"
                 net_map[net_name] = new_net_name
-                if new_net_name not in flattened_module['nets']:
-                    flattened_module['nets'].append(new_net_name)
+                flat_nets[new_net_name] = None
         
         # --- 2. Expand the submodule instance ---
         # Add cells from the submodule definition into the flattened module
         for sub_cell_name, sub_cell_data in submodule_def['cells'].items():
             new_cell_name = f"{instance_name}_{sub_cell_name}"
-            new_cell_data = json.loads(json.dumps(sub_cell_data))
             
-            # Update connections using the net map
-            new_cell_data['connections']['inputs'] = [net_map[n] for n in new_cell_data['connections']['inputs']]
-            new_cell_data['connections']['outputs'] = [net_map[n] for n in new_cell_data['connections']['outputs']]
+            # New connection lists with every net renamed through the net map
+            new_cell_data = Cell(sub_cell_data.type, {
+                'inputs': [net_map[n] for n in sub_cell_data.connections['inputs']],
+                'outputs': [net_map[n] for n in sub_cell_data.connections['outputs']]
+            })
             
-            flattened_module['cells'][new_cell_name] = new_cell_data
+            flat_cells[new_cell_name] = new_cell_data
+        pending.extend(f"{instance_name}_{sub_instance}" for sub_instance in submodule_def['sub_instances'])
             
         # --- 3. Update fanouts ---
         if 'fanouts' in submodule_def:
@@ -510,17 +807,97 @@ def flatten_netlist(netlist_dict):
                 new_source = net_map[source_net]
                 new_dests = [net_map[n] for n in dest_nets]
                 
-                if new_source in flattened_module['fanouts']:
-                    flattened_module['fanouts'][new_source].extend(new_dests)
+                if new_source in flat_fanouts:
+                    flat_fanouts[new_source].extend(new_dests)
                 else:
-                    flattened_module['fanouts'][new_source] = new_dests
+                    flat_fanouts[new_source] = new_dests
 
         # --- 4. Cleanup ---
         # Remove the submodule instance that has been expanded
-        del flattened_module['cells'][instance_name]
+        del flat_cells[instance_name]
 
+    flattened_module['nets'] = list(flat_nets)
     return {top_module_name: flattened_module}
 
+def build_cells_soa(cells):
+    """
+    Struct-of-arrays view of a cells dict: parallel name and type lists plus
+    flat input and output net lists indexed CSR-style, so the inputs of cell i
+    are inputs[input_offsets[i]:input_offsets[i+1]] (likewise for outputs).
+    """
+    types = []
+    inputs, outputs = [], []
+    input_offsets, output_offsets = [0], [0]
+    for cell_data in cells.values():
+        types.append(cell_data['type'])
+        inputs.extend(cell_data['connections']['inputs'])
+        outputs.extend(cell_data['connections']['outputs'])
+        input_offsets.append(len(inputs))
+        output_offsets.append(len(outputs))
+    return {
+        "names": list(cells),
+        "types": types,
+        "inputs": inputs,
+        "input_offsets": input_offsets,
+        "outputs": outputs,
+        "output_offsets": output_offsets
+    }
+
+def dump_fragment(value, indent=0):
+    """
+    Serializes one piece of the netlist as indented JSON bytes, shifted right by
+    `indent` spaces so it can be spliced into the enclosing document.
+    """
+    if orjson is not None:
+        text = orjson.dumps(value, option=orjson.OPT_INDENT_2)
+    else:
+        text = json.dumps(value, indent=2).encode()
+    if indent:
+        text = text.replace(b'\n', b'\n' + b' ' * indent)
+    return text
+
+def iter_netlist_fragments(netlist):
+    """
+    Yields the netlist JSON document in pieces, one port, cell, net or fanout
+    entry at a time, so the serialized form of a large flat netlist is never
+    held in memory at once.
+    """
+    yield b'{'
+    for module_index, (module_name, module) in enumerate(netlist.items()):
+        yield (b',' if module_index else b'') + b'\n  ' + dump_fragment(module_name) + b': {'
+        for section_index, (section, value) in enumerate(module.items()):
+            yield (b',' if section_index else b'') + b'\n    ' + dump_fragment(section) + b': '
+            if isinstance(value, dict) and value:
+                yield b'{'
+                for entry_index, (key, entry) in enumerate(value.items()):
+                    yield (b',' if entry_index else b'') + b'\n      ' + dump_fragment(key) + b': ' + dump_fragment(entry, 6)
+                yield b'\n    }'
+            elif isinstance(value, list) and value:
+                yield b'['
+                for entry_index, entry in enumerate(value):
+                    yield (b',' if entry_index else b'') + b'\n      ' + dump_fragment(entry, 6)
+                yield b'\n    ]'
+            else:
+                yield dump_fragment(value, 4)
+        yield b'\n  }'
+    yield b'\n}'
+
+def write_json_netlist(output_path, netlist, compact=False):
+    """
+    Writes the netlist as indented JSON, streamed through iter_netlist_fragments,
+    or as JSON without any whitespace when compact is set.
+    Key order is significant (top module first, port order), so keys are never sorted.
+    """
+    if compact and orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(netlist))
+    elif compact:
+        with open(output_path, 'w') as f:
+            json.dump(netlist, f, separators=(',', ':'), ensure_ascii=False)
+    else:
+        with open(output_path, 'wb') as f:
+            f.writelines(iter_netlist_fragments(netlist))
+
 def process_verilog_files(folder_path):
     """
     Finds all .v files, extracts unique module definitions, and writes them
@@ -531,8 +908,8 @@ def process_verilog_files(folder_path):
         str: The absolute path to the newly created Verilog file.
     """
     try:
-        all_files = os.listdir(folder_path)
-        v_files = [f for f in all_files if f.endswith('.v')]
+        with os.scandir(folder_path) as entries:
+            v_files = [entry.name for entry in entries if entry.name.endswith('.v') and entry.is_file()]
     except FileNotFoundError:
         print(f"Error: The directory '{folder_path}' was not found.")
         sys.exit(1)
@@ -542,8 +919,7 @@ def process_verilog_files(folder_path):
         sys.exit(1)
 
     # Identify the top file to determine the top module's name
-    top_file_pattern = re.compile(r'^combinatorial_\d+\.v$')
-    top_files_found = [f for f in v_files if top_file_pattern.match(f)]
+    top_files_found = [f for f in v_files if _TOP_FILE_RE.match(f)]
 
     if len(top_files_found) != 1:
         print(f"Error: Expected exactly one top file matching 'combinatorial_<integer>.v', but found {len(top_files_found)}.")
@@ -558,33 +934,52 @@ def process_verilog_files(folder_path):
     # Process all .v files to find and store unique modules
     for file_name in v_files:
         file_path = os.path.join(folder_path, file_name)
-        with open(file_path, 'r') as f:
-            content = f.read()
-
-        # Find all module definitions in the current file
-        module_definitions = re.findall(r'(\bmodule\s+.*?\bendmodule)', content, re.DOTALL)
+        with open(file_path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Find all module definitions in the current file, name and code in one pass
+                module_definitions = [match.group(1, 0) for match in _MODULE_DEF_RE.finditer(mm)]
         
-        for module_code in module_definitions:
-            match = re.search(r'\bmodule\s+(\w+)', module_code)
-            if match:
-                module_name = match.group(1)
-                
-                # Store the module's source code if it's new
-                if module_name not in unique_modules:
-                    unique_modules[module_name] = module_code
-                
-                # Identify the top module from the designated top file
-                if file_name == top_file_name and not top_module_name_from_file:
-                    top_module_name_from_file = module_name
+        for module_name, module_code in module_definitions:
+            # Decoded only once the map is closed. Non-UTF-8 bytes (e.g. a Latin-1 comment)
+            # are carried through as surrogates and written back unchanged below
+            module_name = module_name.decode(errors='surrogateescape')
+            module_code = module_code.decode(errors='surrogateescape')
+            if '\r' in module_code:
+                module_code = module_code.replace('\r\n', '\n').replace('\r', '\n')
+            
+            # Store the module's source code if it's new
+            if module_name not in unique_modules:
+                unique_modules[module_name] = module_code
+            
+            # Identify the top module from the designated top file
+            if file_name == top_file_name and not top_module_name_from_file:
+                top_module_name_from_file = module_name
 
     # Assemble the final, de-duplicated Verilog content
     if not top_module_name_from_file:
         print(f"Error: Could not determine top module name from '{top_file_name}'.")
         sys.exit(1)
         
-    final_content = unique_modules.pop(top_module_name_from_file, '') + '\n\n'
-    for module_code in unique_modules.values():
-        final_content += module_code + '\n\n'
+    # Keep only modules reachable from the top so unused library modules are never parsed.
+    # Any identifier naming a known module counts as a use, which can only over-include.
+    # A set, since membership is tested for every word of every reached module; the
+    # merged file keeps the modules in unique_modules order
+    reachable = {top_module_name_from_file}
+    pending = [top_module_name_from_file]
+    while pending:
+        module_code = unique_modules[pending.pop()]
+        for identifier in set(_WORD_RE.findall(module_code)):
+            if identifier in unique_modules and identifier not in reachable:
+                reachable.add(identifier)
+                pending.append(identifier)
+
+    # Each extracted definition runs from 'module' to 'endmodule', so joining them needs
+    # no stripping afterwards and the merged text is built in a single allocation
+    merged_modules = [unique_modules.pop(top_module_name_from_file)]
+    merged_modules.extend(module_code for module_name, module_code in unique_modules.items() if module_name in reachable)
+    final_content = '\n\n'.join(merged_modules)
         
     # --- File naming logic ---
     base_output_name = "all_modules.v"
@@ -592,15 +987,28 @@ def process_verilog_files(folder_path):
     counter = 1
     output_file_path = os.path.join(folder_path, base_output_name)
 
-    # If file exists, find a unique name by appending a number
-    while os.path.exists(output_file_path):
-        new_filename = f"{name}_{counter}{ext}"
-        output_file_path = os.path.join(folder_path, new_filename)
-        counter += 1
+    # If file exists, find a unique name by appending a number. The name is claimed with
+    # O_EXCL, so two runs on the same folder can never end up writing the same file.
+    # O_BINARY keeps Windows from translating newlines a second time below the text layer.
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        try:
+            fd = os.open(output_file_path, flags, 0o644)
+            break
+        except FileExistsError:
+            new_filename = f"{name}_{counter}{ext}"
+            output_file_path = os.path.join(folder_path, new_filename)
+            counter += 1
     
-    # Write the clean, merged content to the uniquely named output file
-    with open(output_file_path, 'w') as f:
-        f.write(final_content.strip())
+    # Write the clean, merged content to the uniquely named output file. The text was
+    # decoded as UTF-8 with surrogateescape, so encoding it the same way (not with the
+    # locale codec) writes every source byte back unchanged
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            f.write(final_content)
+    except BaseException:
+        os.remove(output_file_path)
+        raise
     
     #final_filename = os.path.basename(output_file_path)
     #print(f"Success! All unique modules have been merged into '{final_filename}'.")
@@ -609,20 +1017,26 @@ def process_verilog_files(folder_path):
     return os.path.abspath(output_file_path)
 
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python verilog_to_netlist.py <path_to_folder>")
-        sys.exit(1)
-    
-    directory_path = sys.argv[1]
+def netlist_filename(directory_path, output_format='json'):
+    """
+    Name of the netlist file written into NETLISTS for a design folder.
+    """
+    return f'netlist_{os.path.basename(directory_path)}.{output_format}'
+
 
+def generate_netlist(directory_path, strict=False, sort_nets=False, soa=False, output_format='json', compact=False):
+    """
+    Builds the flattened netlist for one design folder and writes it into the
+    NETLISTS folder as JSON or MessagePack. Returns the path of the written file.
+    """
     all_modules_file = process_verilog_files(directory_path)
     
-    generated_netlist = create_json_netlist(all_modules_file)
-    
-    directory_name = os.path.basename(directory_path)
+    generated_netlist = create_json_netlist(all_modules_file, strict, sort_nets)
+    if soa:
+        for module in generated_netlist.values():
+            module['cells_soa'] = build_cells_soa(module['cells'])
     
-    output_json_file = f'netlist_{directory_name}.json'
+    output_json_file = netlist_filename(directory_path, output_format)
     
     # Define the output directory and ensure it exists
     output_dir = "NETLISTS"
@@ -631,13 +1045,85 @@ def main():
     # Construct the full path for the output file
     output_path = os.path.join(output_dir, output_json_file)
 
-    with open(output_path, 'w') as f:
-        json.dump(generated_netlist, f, indent=4)
-        
-    print(f"Successfully generated netlist at '{output_path}'")
+    if output_format == 'msgpack':
+        with open(output_path, 'wb') as f:
+            msgpack.pack(generated_netlist, f, use_bin_type=True)
+    else:
+        write_json_netlist(output_path, generated_netlist, compact)
 
     os.remove(all_modules_file) #cleanup all_modules.v
 
+    return output_path
+
+
+def generate_netlist_or_none(directory_path, **options):
+    """
+    generate_netlist for one folder of a multi-folder run. Returns None when the
+    folder fails, so a worker's sys.exit or exception does not end the other folders.
+    """
+    try:
+        return generate_netlist(directory_path, **options)
+    except SystemExit:
+        # process_verilog_files has already printed the reason
+        return None
+    except Exception as e:
+        print(f"Error: Could not generate a netlist for '{directory_path}': {e}")
+        return None
+
+
+def main():
+    args = sys.argv[1:]
+    strict = '--strict' in args
+    sort_nets = '--sort-nets' in args
+    soa = '--soa' in args
+    compact = '--compact' in args
+    args = [a for a in args if a not in ('--strict', '--sort-nets', '--soa', '--compact')]
+    output_format = 'json'
+    if '--format' in args:
+        index = args.index('--format')
+        output_format = args[index + 1] if index + 1 < len(args) else None
+        del args[index:index + 2]
+    if not args or output_format not in ('json', 'msgpack'):
+        print("Usage: python verilog_to_netlist.py <path_to_folder> [<path_to_folder> ...] [--strict] [--sort-nets] [--soa] [--compact] [--format json|msgpack]")
+        sys.exit(1)
+    if output_format == 'msgpack' and msgpack is None:
+        print("Error: --format msgpack needs the msgpack package (pip install msgpack).")
+        sys.exit(1)
+
+    options = dict(strict=strict, sort_nets=sort_nets, soa=soa, output_format=output_format, compact=compact)
+    if len(args) == 1:
+        output_path = generate_netlist(args[0], **options)
+        print(f"Successfully generated netlist at '{output_path}'")
+        return
+
+    # Output names come from the folder name alone, so folders sharing a name (or a folder
+    # given twice) would have their workers overwrite one netlist and race on all_modules.v
+    folders_by_output = {}
+    folders_by_path = {}
+    for directory_path in args:
+        output_file = netlist_filename(directory_path, output_format)
+        real_path = os.path.realpath(directory_path)
+        if output_file in folders_by_output:
+            print(f"Error: Folders '{folders_by_output[output_file]}' and '{directory_path}' would both write NETLISTS/{output_file}. Give each design folder once, with distinct folder names.")
+            sys.exit(1)
+        if real_path in folders_by_path:
+            print(f"Error: '{folders_by_path[real_path]}' and '{directory_path}' are the same design folder. Give each design folder once.")
+            sys.exit(1)
+        folders_by_output[output_file] = directory_path
+        folders_by_path[real_path] = directory_path
+
+    # Each design folder is independent, so they are parsed in separate worker processes
+    failed = False
+    generate = functools.partial(generate_netlist_or_none, **options)
+    with ProcessPoolExecutor() as executor:
+        for output_path in executor.map(generate, args):
+            if output_path is None:
+                failed = True
+            else:
+                print(f"Successfully generated netlist at '{output_path}'")
+    if failed:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file